@@ -31,19 +31,56 @@
 # PROVIDED HEREUNDER IS PROVIDED "AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE
 # MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
-import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from botocore.exceptions import ClientError
 
 from .cloud_instance import CloudInstance
-from .name_generator import get_unique_name
 
 
 class AWSCloudInstance(CloudInstance):
     """AWS Implementation of CloudInstance."""
 
+    # Ports opened by the security group: SSH, WireGuard, and the
+    # Foxglove Studio and rosbridge ports used when launch_foxglove is set.
+    # All ROS traffic goes through the WireGuard tunnel.
+    ec2_ingress_ports = [
+        ("tcp", 22),
+        ("udp", 51820),
+        ("tcp", 8080),
+        ("tcp", 9090),
+    ]
+
+    # default VPC id per region, shared by all instances
+    _default_vpc_ids = {}
+    _default_vpc_lock = threading.Lock()
+
+    # boto3 clients and resources per region, shared by all instances
+    _ec2_clients = {}
+    _ec2_resources = {}
+    _boto3_lock = threading.Lock()
+
+    @classmethod
+    def _ec2_client(cls, region):
+        with cls._boto3_lock:
+            client = cls._ec2_clients.get(region)
+            if client is None:
+                client = boto3.client("ec2", region)
+                cls._ec2_clients[region] = client
+            return client
+
+    @classmethod
+    def _ec2_resource(cls, region):
+        with cls._boto3_lock:
+            resource = cls._ec2_resources.get(region)
+            if resource is None:
+                resource = boto3.resource("ec2", region)
+                cls._ec2_resources[region] = resource
+            return resource
+
     def __init__(
         self,
         ami_image,
@@ -51,6 +88,89 @@ class AWSCloudInstance(CloudInstance):
         ec2_instance_type="t2.micro",
         disk_size=30,
         **kwargs,
+    ):
+        self._setup(ami_image, region, ec2_instance_type, disk_size, **kwargs)
+        self.create()
+
+    @classmethod
+    def create_fleet(
+        cls,
+        count,
+        ami_image,
+        region="us-west-1",
+        ec2_instance_type="t2.micro",
+        disk_size=30,
+        **kwargs,
+    ):
+        """
+        Launch several identical instances with a single RunInstances call.
+
+        The fleet shares one security group and one key pair, and its names
+        are checked for collisions in a single batch, so those API calls do
+        not grow with the size of the fleet. Each member except the first
+        still needs its own CreateTags call to carry its name.
+
+        @param count: number of instances to launch
+        @return: list of AWSCloudInstance, one per launched instance
+        """
+        if count < 1:
+            raise ValueError(f"Fleet size must be at least 1, got {count}")
+
+        fleet = [cls.__new__(cls) for _ in range(count)]
+        for machine in fleet:
+            machine._setup(
+                ami_image,
+                region,
+                ec2_instance_type,
+                disk_size,
+                resolve_name=False,
+                **kwargs,
+            )
+        cls._resolve_names(fleet)
+        leader = fleet[0]
+        leader.logger.info(f"Creating fleet of {count} EC2 instances")
+
+        leader.create_security_group_and_key_pair()
+        for machine in fleet[1:]:
+            machine.ec2_security_group_ids = leader.ec2_security_group_ids
+            machine.ec2_key_name = leader.ec2_key_name
+            machine._ssh_key = leader._ssh_key
+            machine._ssh_key_path = os.path.join(
+                machine._working_dir, f"{machine.ec2_key_name}.pem"
+            )
+
+        # write the key files while the instances launch
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            key_files = [
+                executor.submit(machine.write_ssh_key) for machine in fleet
+            ]
+            instances = leader.launch_ec2_instances(count)
+            leader.wait_until_running(instances)
+            for key_file in key_files:
+                key_file.result()
+        for machine, instance in zip(fleet, instances):
+            if machine is not leader:
+                # all instances were tagged with the leader's name at launch
+                instance.create_tags(
+                    Tags=[{"Key": "FogROS2-Name", "Value": machine._name}]
+                )
+            machine.ec2_instance = instance
+            machine.wait_for_public_ip()
+
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = [executor.submit(machine.provision) for machine in fleet]
+            for future in futures:
+                future.result()
+        return fleet
+
+    def _setup(
+        self,
+        ami_image,
+        region,
+        ec2_instance_type,
+        disk_size,
+        resolve_name=True,
+        **kwargs,
     ):
         super().__init__(**kwargs)
         self.cloud_service_provider = "AWS"
@@ -62,79 +182,106 @@ class AWSCloudInstance(CloudInstance):
 
         # aws objects
         self.ec2_instance = None
-        self.ec2_resource_manager = boto3.resource("ec2", self.region)
-        self.ec2_boto3_client = boto3.client("ec2", self.region)
+        self.ec2_resource_manager = self._ec2_resource(self.region)
+        self.ec2_boto3_client = self._ec2_client(self.region)
 
-        # Check for name collision among other AWS instances
-        cur_instances = self.ec2_boto3_client.describe_instances(
-            Filters=[
-                {
-                    "Name": "instance.group-name",
-                    "Values": ["FOGROS2_SECURITY_GROUP"],
-                },
-                {"Name": "tag:FogROS2-Name", "Values": [self._name]},
-            ]
-        )
-        while len(cur_instances["Reservations"]) > 0:
-            self._name = get_unique_name()
-            cur_instances = self.ec2_boto3_client.describe_instances(
+        # key & security group names
+        self.ec2_security_group = "FOGROS2_SECURITY_GROUP"
+        self.ec2_key_name = None
+
+        # after config
+        self._ssh_key = None
+        self.ec2_security_group_ids = None
+
+        if resolve_name:
+            self._resolve_names([self])
+
+    @staticmethod
+    def _resolve_names(machines):
+        # Check for name collision among other AWS instances (and within
+        # the batch), with one DescribeInstances call for all the names.
+        client = machines[0].ec2_boto3_client
+        names = [machine.name for machine in machines]
+        while True:
+            response = client.describe_instances(
                 Filters=[
                     {
                         "Name": "instance.group-name",
                         "Values": ["FOGROS2_SECURITY_GROUP"],
                     },
-                    {"Name": "tag:FogROS2-Name", "Values": [self._name]},
+                    {"Name": "tag:FogROS2-Name", "Values": names},
                 ]
             )
-        self._working_dir = os.path.join(self._working_dir_base, self._name)
-        os.makedirs(self._working_dir, exist_ok=True)
+            taken = {
+                tag["Value"]
+                for res in response["Reservations"]
+                for inst in res["Instances"]
+                for tag in inst.get("Tags", [])
+                if tag["Key"] == "FogROS2-Name"
+            }
+            seen = set()
+            collided = False
+            for i, machine in enumerate(machines):
+                if names[i] in taken or names[i] in seen:
+                    names[i] = machine._generate_name()
+                    collided = True
+                seen.add(names[i])
+            if not collided:
+                break
 
-        # key & security group names
-        self.ec2_security_group = "FOGROS2_SECURITY_GROUP"
-        self.ec2_key_name = f"FogROS2KEY-{self._name}"
+        for machine, name in zip(machines, names):
+            machine.set_name(name)
+
+    def set_name(self, name):
+        super().set_name(name)
+        self.ec2_key_name = f"FogROS2KEY-{name}"
         self._ssh_key_path = os.path.join(
             self._working_dir, f"{self.ec2_key_name}.pem"
         )
 
-        # Auto-delete key pair collision (since any instance using this key
-        # pair would be terminated already, otherwise it would be found in
-        # the previous collision check)
-        self.ec2_boto3_client.delete_key_pair(KeyName=self.ec2_key_name)
-
-        # after config
-        self._ssh_key = None
-        self.ec2_security_group_ids = None
-
-        self.create()
-
     def create(self):
         self.logger.info(f"Creating new EC2 instance with name {self._name}")
-        self.create_security_group()
-        self.generate_key_pair()
-        self.create_ec2_instance()
+        self.create_security_group_and_key_pair()
+        # The key file is only needed once we connect, so write it while
+        # the instance launches.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            key_file = executor.submit(self.write_ssh_key)
+            self.create_ec2_instance()
+            key_file.result()
+        self.provision()
+
+    def provision(self):
         self.info(flush_to_disk=True)
         self.connect()
-        # Uncomment out the next three lines if you are not using a custom AMI
-        self.install_ros()
-        self.install_cloud_dependencies()
-        self.install_colcon()
-        self.push_ros_workspace()
-        self.info(flush_to_disk=True)
-        self._is_created = True
+        # The workspace is pushed over its own ssh connection, so it can be
+        # uploaded while the dependencies are installed.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            workspace = executor.submit(self.push_ros_workspace)
+            # Uncomment out the next three lines if you are not using a custom AMI
+            self.install_ros()
+            self.install_cloud_dependencies()
+            self.install_colcon()
+            workspace.result()
+        self._created.set()
 
-    def info(self, flush_to_disk=True):
-        info_dict = super().info(flush_to_disk)
+    def _info_dict(self):
+        info_dict = super()._info_dict()
         info_dict["ec2_region"] = self.region
         info_dict["ec2_instance_type"] = self.ec2_instance_type
         info_dict["disk_size"] = self.ec2_instance_disk_size
         info_dict["aws_ami_image"] = self.aws_ami_image
         info_dict["ec2_instance_id"] = self.ec2_instance.instance_id
-        if flush_to_disk:
-            with open(os.path.join(self._working_dir, "info"), "w+") as f:
-                json.dump(info_dict, f)
         return info_dict
 
     def get_default_vpc(self):
+        with self._default_vpc_lock:
+            vpc_id = self._default_vpc_ids.get(self.region)
+            if vpc_id is None:
+                vpc_id = self._find_default_vpc()
+                self._default_vpc_ids[self.region] = vpc_id
+        return vpc_id
+
+    def _find_default_vpc(self):
         response = self.ec2_boto3_client.describe_vpcs(
             Filters=[{"Name": "is-default", "Values": ["true"]}]
         )
@@ -157,69 +304,106 @@ class AWSCloudInstance(CloudInstance):
         self.logger.info(f"Using VPC: {vpc_id}")
         return vpc_id
 
-    def create_security_group(self):
-        vpc_id = self.get_default_vpc()
+    def find_security_group(self):
         try:
             response = self.ec2_boto3_client.describe_security_groups(
                 GroupNames=[self.ec2_security_group]
             )
-            security_group_id = response["SecurityGroups"][0]["GroupId"]
         except ClientError as e:
-            # check if the group does not exist. we'll create one in
-            # that case.  Any other error is unexpected and re-thrown.
+            # check if the group does not exist. Any other error is
+            # unexpected and re-thrown.
             if e.response["Error"]["Code"] != "InvalidGroup.NotFound":
                 raise e
+            return None
+        return response["SecurityGroups"][0]["GroupId"]
 
+    def create_security_group(self):
+        security_group_id = self.find_security_group()
+        if security_group_id is None:
             self.logger.warn("Security group does not exist, creating.")
-            response = self.ec2_boto3_client.create_security_group(
-                GroupName=self.ec2_security_group,
-                Description=(
-                    "Security group used by FogROS 2 (safe to delete"
-                    " when FogROS 2 is not in use)"
-                ),
-                VpcId=vpc_id,
-            )
-            security_group_id = response["GroupId"]
-            self.logger.info(
-                f"Security group {security_group_id} created in vpc {vpc_id}."
-            )
+            vpc_id = self.get_default_vpc()
+            try:
+                response = self.ec2_boto3_client.create_security_group(
+                    GroupName=self.ec2_security_group,
+                    Description=(
+                        "Security group used by FogROS 2 (safe to delete"
+                        " when FogROS 2 is not in use)"
+                    ),
+                    VpcId=vpc_id,
+                )
+            except ClientError as e:
+                # Another launch may have created the group since we
+                # looked it up; use theirs rather than failing this one.
+                if e.response["Error"]["Code"] != "InvalidGroup.Duplicate":
+                    raise e
+                security_group_id = self.find_security_group()
+                if security_group_id is None:
+                    raise e
+                self.logger.info(
+                    f"Security group {security_group_id} was created "
+                    "concurrently, using it."
+                )
+            else:
+                security_group_id = response["GroupId"]
+                self.logger.info(
+                    f"Security group {security_group_id} created in vpc "
+                    f"{vpc_id}."
+                )
 
-            data = self.ec2_boto3_client.authorize_security_group_ingress(
-                GroupId=security_group_id,
-                IpPermissions=[
-                    {
-                        "IpProtocol": "-1",
-                        "FromPort": 0,
-                        "ToPort": 65535,
-                        "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
-                    }
-                ],
-            )
-            self.logger.info(f"Ingress Successfully Set {data}")
+                data = self.ec2_boto3_client.authorize_security_group_ingress(
+                    GroupId=security_group_id,
+                    IpPermissions=[
+                        {
+                            "IpProtocol": protocol,
+                            "FromPort": port,
+                            "ToPort": port,
+                            "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+                            "Ipv6Ranges": [{"CidrIpv6": "::/0"}],
+                        }
+                        for protocol, port in self.ec2_ingress_ports
+                    ],
+                )
+                self.logger.info(f"Ingress Successfully Set {data}")
 
         self.logger.info(f"Using security group id: {security_group_id}")
         self.ec2_security_group_ids = [security_group_id]
 
+    def create_security_group_and_key_pair(self):
+        # the security group and key pair are independent API calls
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            security_group = executor.submit(self.create_security_group)
+            key_pair = executor.submit(self.generate_key_pair)
+            security_group.result()
+            key_pair.result()
+
     def generate_key_pair(self):
+        # Auto-delete key pair collision (since any instance using this key
+        # pair would be terminated already, otherwise it would be found in
+        # the name collision check)
+        self.ec2_boto3_client.delete_key_pair(KeyName=self.ec2_key_name)
+
         ec2_keypair = self.ec2_boto3_client.create_key_pair(
             KeyName=self.ec2_key_name
         )
         self._ssh_key = ec2_keypair["KeyMaterial"]
 
+    def write_ssh_key(self):
         # Since we're writing an SSH key, make sure to write with
-        # user-only permissions.
-        with open(
-            os.open(self._ssh_key_path, os.O_CREAT | os.O_WRONLY, 0o600), "w"
-        ) as f:
+        # user-only permissions. The mode passed to os.open only applies
+        # to new files, so also tighten it on a key file that already exists.
+        fd = os.open(
+            self._ssh_key_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600
+        )
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
             f.write(self._ssh_key)
 
-    def create_ec2_instance(self):
-        # start EC2 instance
-        # note that we can start muliple instances at the same time
-        instances = self.ec2_resource_manager.create_instances(
+    def launch_ec2_instances(self, count):
+        # all instances are tagged with this instance's name
+        return self.ec2_resource_manager.create_instances(
             ImageId=self.aws_ami_image,
-            MinCount=1,
-            MaxCount=1,
+            MinCount=count,
+            MaxCount=count,
             InstanceType=self.ec2_instance_type,
             KeyName=self.ec2_key_name,
             SecurityGroupIds=self.ec2_security_group_ids,
@@ -235,25 +419,38 @@ class AWSCloudInstance(CloudInstance):
                     "DeviceName": "/dev/sda1",
                     "Ebs": {
                         "VolumeSize": self.ec2_instance_disk_size,
-                        "VolumeType": "standard",
+                        "VolumeType": "gp3",
+                        "Iops": 3000,
+                        "Throughput": 125,
                     },
                 }
             ],
         )
 
-        self.ec2_instance = instances[0]
+    def create_ec2_instance(self):
+        self.ec2_instance = self.launch_ec2_instances(1)[0]
+
+        self.wait_until_running([self.ec2_instance])
+        self.wait_for_public_ip()
 
+    def wait_until_running(self, instances):
         # use the boto3 waiter
         self.logger.info("Waiting for launching to finish")
-        self.ec2_instance.wait_until_running()
+        self.ec2_boto3_client.get_waiter("instance_running").wait(
+            InstanceIds=[instance.id for instance in instances],
+            WaiterConfig={"Delay": 5, "MaxAttempts": 40},
+        )
 
-        # reload instance object until IP
+    def wait_for_public_ip(self):
+        # A running instance has its public IP assigned already, so one
+        # reload is enough.
         self.ec2_instance.reload()
         self._ip = self.ec2_instance.public_ip_address
-        while not self._ip:
-            self.ec2_instance.reload()
-            self.logger.info("Waiting for launching to finish")
-            self._ip = self.ec2_instance.public_ip_address
+        if not self._ip:
+            raise RuntimeError(
+                f"Instance {self.ec2_instance.id} is running but has no "
+                "public IP address"
+            )
         self.logger.info(
             f"Created {self.ec2_instance_type} instance named {self._name} "
             f"with id {self.ec2_instance.id} and public IP address {self._ip}"
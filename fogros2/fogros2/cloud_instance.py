@@ -34,7 +34,10 @@
 import abc
 import json
 import os
+import shlex
+import shutil
 import subprocess
+import threading
 
 from rclpy import logging
 
@@ -45,7 +48,7 @@ from .scp import SCPClient
 from .util import (
     MissingEnvironmentVariableException,
     instance_dir,
-    make_zip_file,
+    work_dir,
 )
 
 
@@ -76,23 +79,40 @@ class CloudInstance(abc.ABC):
         self.ros_workspace = ros_workspace
         self.ros_distro = os.getenv("ROS_DISTRO")
         self.logger.debug(f"Using ROS workspace: {self.ros_workspace}")
-        self._name = get_unique_name()
         self._working_dir_base = working_dir_base
+        # Subclasses may still rename the instance, so the working
+        # directory is only created once they call set_name.
+        self._name = self._generate_name()
         self._working_dir = os.path.join(self._working_dir_base, self._name)
-        os.makedirs(self._working_dir, exist_ok=True)
         self._ssh_key_path = None
-        self._is_created = False
+        self._flushed_info = None
+        self._created = threading.Event()
         self.cloud_service_provider = None
         self.dockers = []
         self.launch_foxglove = launch_foxglove
         self._username = 'ubuntu'
+        # relative to the remote home directory
+        self.launch_script_path = "launch.sh"
 
     @abc.abstractmethod
     def create(self):
         pass
 
-    def info(self, flush_to_disk=True):
-        info_dict = {
+    def set_name(self, name):
+        # Fix the instance name and create its working directory.
+        self._name = name
+        self._working_dir = os.path.join(self._working_dir_base, name)
+        os.makedirs(self._working_dir, exist_ok=True)
+
+    def _generate_name(self):
+        # never reuse the working directory of an earlier instance
+        name = get_unique_name()
+        while os.path.exists(os.path.join(self._working_dir_base, name)):
+            name = get_unique_name()
+        return name
+
+    def _info_dict(self):
+        return {
             "name": self._name,
             "cloud_service_provider": self.cloud_service_provider,
             "ros_workspace": self.ros_workspace,
@@ -100,9 +120,19 @@ class CloudInstance(abc.ABC):
             "ssh_key_path": self._ssh_key_path,
             "public_ip": self._ip,
         }
+
+    def info(self, flush_to_disk=True):
+        info_dict = self._info_dict()
         if flush_to_disk:
-            with open(os.path.join(self._working_dir, "info"), "w+") as f:
-                json.dump(info_dict, f)
+            info_json = json.dumps(info_dict)
+            if info_json != self._flushed_info:
+                # Write to a temporary file and rename it over the old one,
+                # so readers never see a partially written file.
+                path = os.path.join(self._working_dir, "info")
+                with open(f"{path}.tmp", "w") as f:
+                    f.write(info_json)
+                os.replace(f"{path}.tmp", path)
+                self._flushed_info = info_json
         return info_dict
 
     def force_start_vpn(self):
@@ -123,37 +153,62 @@ class CloudInstance(abc.ABC):
 
     @property
     def is_created(self):
-        return self._is_created
+        return self._created.is_set()
+
+    def wait_until_created(self, timeout=None):
+        """
+        Block until the instance has been created.
+
+        @param timeout: seconds to wait, or None to wait indefinitely
+        @return: True if the instance is created, False on timeout
+        """
+        return self._created.wait(timeout)
 
     @property
     def name(self):
         return self._name
 
+    @staticmethod
+    def apt_install_cmd(args):
+        return f"sudo DEBIAN_FRONTEND=noninteractive apt-get install -y {args}"
+
+    @staticmethod
+    def pip_install_cmd(args):
+        return f"python3 -m pip install {args}"
+
     def apt_install(self, args):
-        self.scp.execute_cmd(
-            f"sudo DEBIAN_FRONTEND=noninteractive apt-get install -y {args}"
-        )
+        self.scp.execute_cmd(self.apt_install_cmd(args))
 
     def pip_install(self, args):
-        self.scp.execute_cmd(f"python3 -m pip install {args}")
+        self.scp.execute_cmd(self.pip_install_cmd(args))
 
     def install_cloud_dependencies(self):
-        self.apt_install("wireguard unzip docker.io python3-pip ros-humble-rmw-cyclonedds-cpp")
-        self.pip_install("boto3")
-        self.pip_install("paramiko")
-        self.pip_install("scp")
-        self.pip_install("wgconfig")
+        cmd_builder = BashBuilder()
+        cmd_builder.append(
+            self.apt_install_cmd(
+                "wireguard unzip docker.io python3-pip "
+                "ros-humble-rmw-cyclonedds-cpp"
+            )
+        )
+        cmd_builder.append(self.pip_install_cmd("boto3 paramiko wgconfig"))
+        self.scp.execute_cmd(cmd_builder.get(), check=True)
 
     def install_ros(self):
+        # All steps are chained into a single remote command, so the
+        # environment set up by earlier steps is visible to later ones.
+        cmd_builder = BashBuilder()
+
         # setup sources
-        self.apt_install("software-properties-common gnupg lsb-release")
-        self.scp.execute_cmd("sudo add-apt-repository universe")
-        self.scp.execute_cmd(
+        cmd_builder.append(
+            self.apt_install_cmd("software-properties-common gnupg lsb-release")
+        )
+        cmd_builder.append("sudo add-apt-repository -y universe")
+        cmd_builder.append(
             "sudo curl -sSL "
             "https://raw.githubusercontent.com/ros/rosdistro/master/ros.key "
             "-o /usr/share/keyrings/ros-archive-keyring.gpg"
         )
-        self.scp.execute_cmd(
+        cmd_builder.append(
             'echo "deb [arch=$(dpkg --print-architecture) '
             "signed-by=/usr/share/keyrings/ros-archive-keyring.gpg] "
             "http://packages.ros.org/ros2/ubuntu $(source /etc/os-release && "
@@ -162,21 +217,20 @@ class CloudInstance(abc.ABC):
         )
 
         # Run apt-get update after adding universe and ROS2 repos.
-        self.scp.execute_cmd("sudo apt-get update")
+        cmd_builder.append("sudo apt-get update")
 
         # set locale
-        self.apt_install("locales")
-        self.scp.execute_cmd("sudo locale-gen en_US en_US.UTF-8")
-        self.scp.execute_cmd(
+        cmd_builder.append(self.apt_install_cmd("locales"))
+        cmd_builder.append("sudo locale-gen en_US en_US.UTF-8")
+        cmd_builder.append(
             "sudo update-locale LC_ALL=en_US.UTF-8 LANG=en_US.UTF-8"
         )
-        self.scp.execute_cmd("export LANG=en_US.UTF-8")
+        cmd_builder.append("export LANG=en_US.UTF-8")
 
         # install ros2 packages
-        self.apt_install(f"ros-{self.ros_distro}-desktop")
+        cmd_builder.append(self.apt_install_cmd(f"ros-{self.ros_distro}-desktop"))
 
-        # source environment
-        self.scp.execute_cmd(f"source /opt/ros/{self.ros_distro}/setup.bash")
+        self.scp.execute_cmd(cmd_builder.get(), check=True)
 
     def configure_rosbridge(self):
         # install rosbridge
@@ -184,44 +238,130 @@ class CloudInstance(abc.ABC):
 
         # source ros and launch rosbridge through ssh
         subprocess.call(f"chmod 400 {self._ssh_key_path}", shell=True)
-        rosbridge_launch_script = (
-            "ssh -o StrictHostKeyChecking=no -i "
-            f"{self._ssh_key_path}"
-            f" {self._username}@"
-            f"{self._ip}"
-            f' "source /opt/ros/{self.ros_distro}/setup.bash && '
-            'ros2 launch rosbridge_server rosbridge_websocket_launch.xml &"'
-        )
-        self.logger.info(rosbridge_launch_script)
-        subprocess.Popen(rosbridge_launch_script, shell=True)
+        rosbridge_launch_script = ["ssh"] + self.ssh_options() + [
+            f"{self._username}@{self._ip}",
+            f"source /opt/ros/{self.ros_distro}/setup.bash && "
+            "ros2 launch rosbridge_server rosbridge_websocket_launch.xml &",
+        ]
+        self.logger.info(" ".join(rosbridge_launch_script))
+        subprocess.Popen(rosbridge_launch_script)
 
     def install_colcon(self):
+        cmd_builder = BashBuilder()
         # ros2 repository
-        self.scp.execute_cmd(
+        cmd_builder.append(
             "sudo sh -c 'echo \"deb [arch=amd64,arm64] "
             'http://repo.ros2.org/ubuntu/main `lsb_release -cs` main" > '
             "/etc/apt/sources.list.d/ros2-latest.list'"
         )
-        self.scp.execute_cmd(
+        cmd_builder.append(
             "curl -s"
             " https://raw.githubusercontent.com/ros/rosdistro/master/ros.asc"
             " | sudo apt-key add -"
         )
-
-        self.pip_install("colcon-common-extensions")
+        cmd_builder.append(self.pip_install_cmd("colcon-common-extensions"))
+        self.scp.execute_cmd(cmd_builder.get(), check=True)
+
+    def ssh_options(self):
+        # Options shared by every ssh subprocess spawned for this instance.
+        # The control socket lets these subprocesses reuse one
+        # authenticated TCP connection instead of redoing the handshake;
+        # commands run through self.scp share its paramiko transport.
+        return [
+            "-i",
+            self._ssh_key_path,
+            "-o",
+            "StrictHostKeyChecking=no",
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={os.path.join(work_dir(), 'cm-%C')}",
+            "-o",
+            "ControlPersist=600",
+        ]
+
+    def pipe_to_remote(self, local_cmds, remote_cmd):
+        """
+        Stream the output of a local pipeline into a remote command.
+
+        @param local_cmds: list of argument lists; each one's stdout is
+            connected to the next one's stdin
+        @param remote_cmd: shell command run over ssh, reading the stdout
+            of the last local command
+        """
+        ssh_cmd = ["ssh"] + self.ssh_options() + [
+            f"{self._username}@{self._ip}",
+            remote_cmd,
+        ]
+        cmds = local_cmds + [ssh_cmd]
+        procs = []
+        upstream = None
+        for cmd in cmds:
+            proc = subprocess.Popen(
+                cmd,
+                stdin=upstream,
+                stdout=None if cmd is ssh_cmd else subprocess.PIPE,
+            )
+            if upstream is not None:
+                # only the downstream process should hold the pipe open, so
+                # a failure there propagates back as SIGPIPE
+                upstream.close()
+            upstream = proc.stdout
+            procs.append(proc)
+
+        # Reap every process before reporting. List the remote side first,
+        # since a failure there kills the local commands with SIGPIPE.
+        returncodes = [proc.wait() for proc in procs]
+        failures = [
+            f"{cmd[0]} exited with status {returncode}"
+            for cmd, returncode in reversed(list(zip(cmds, returncodes)))
+            if returncode != 0
+        ]
+        if failures:
+            raise RuntimeError(", ".join(failures))
 
     def push_ros_workspace(self):
-        # configure ROS env
-        workspace_path = self.ros_workspace  # os.getenv("COLCON_PREFIX_PATH")
-        zip_dst = "/tmp/ros_workspace"
-        make_zip_file(workspace_path, zip_dst)
-        self.scp.execute_cmd("echo removing old workspace")
-        self.scp.execute_cmd("rm -rf ros_workspace.zip ros2_ws fog_ws")
-        # self.scp.send_file(f"{zip_dst}.zip", "/home/ubuntu/")
-        self.scp.send_file(f"{zip_dst}.tar", "/home/ubuntu/")
-        # self.scp.execute_cmd("unzip -q /home/ubuntu/ros_workspace.zip")
-        self.scp.execute_cmd("tar -xf /home/ubuntu/ros_workspace.tar")
-        self.scp.execute_cmd("echo successfully extracted new workspace")
+        self.logger.info(f"Pushing ROS workspace {self.ros_workspace}")
+        if shutil.which("rsync"):
+            try:
+                self.rsync_ros_workspace()
+                return
+            except subprocess.CalledProcessError as e:
+                self.logger.warn(f"{e}, falling back to tar")
+        self.stream_ros_workspace()
+
+    def rsync_ros_workspace(self):
+        # rsync only transfers files that differ from the copy already on
+        # the instance, so pushing again after a small change is cheap.
+        subprocess.run(
+            [
+                "rsync",
+                "-az",
+                "--compress-level=1",
+                "--delete",
+                "--exclude=.git",
+                "-e",
+                shlex.join(["ssh"] + self.ssh_options()),
+                f"{self.ros_workspace}/",
+                f"{self._username}@{self._ip}:fog_ws/",
+            ],
+            check=True,
+        )
+
+    def stream_ros_workspace(self):
+        # Stream the workspace as a compressed tar archive directly into
+        # tar on the remote; nothing is staged on disk on either side.
+        # pigz compresses on all local cores when it is available.
+        compressor = "pigz" if shutil.which("pigz") else "gzip"
+        self.pipe_to_remote(
+            [
+                ["tar", "-C", self.ros_workspace, "--exclude=.git", "-cf", "-", "."],
+                [compressor, "-1"],
+            ],
+            "rm -rf ros_workspace.tar ros2_ws fog_ws && mkdir fog_ws && "
+            "tar -xzf - -C fog_ws && "
+            "echo successfully extracted new workspace",
+        )
 
     def push_to_cloud_nodes(self):
         self.scp.send_file(
@@ -242,9 +382,14 @@ class CloudInstance(abc.ABC):
         self.cyclone_builder = CycloneConfigBuilder(["10.0.0.1"], username=self._username)
         self.cyclone_builder.generate_config_file()
         self.scp.send_file("/tmp/cyclonedds.xml", "~/cyclonedds.xml")
+        self.push_launch_script()
 
-    def launch_cloud_node(self):
-        cmd_builder = BashBuilder()
+    def push_launch_script(self):
+        # The launch script only depends on the DDS configuration, so it is
+        # written once here and left on the instance for launch_cloud_node.
+        cmd_builder = BashBuilder(
+            cmd_save_path=os.path.join(self._working_dir, "launch.sh")
+        )
         cmd_builder.append(f"source /opt/ros/{self.ros_distro}/setup.bash")
         cmd_builder.append(
             f"cd /home/{self._username}/fog_ws && colcon build --cmake-clean-cache"
@@ -259,7 +404,11 @@ class CloudInstance(abc.ABC):
             "ros2 launch fogros2 cloud.launch.py"
         )
         self.logger.info(cmd_builder.get())
-        self.scp.execute_cmd(cmd_builder.get())
+        cmd_builder.save()
+        self.scp.send_file(cmd_builder.cmd_save_path, self.launch_script_path)
+
+    def launch_cloud_node(self):
+        self.scp.execute_cmd(f"bash {self.launch_script_path}")
 
     def add_docker_container(self, cmd):
         self.dockers.append(cmd)
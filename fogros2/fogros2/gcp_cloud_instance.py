@@ -31,7 +31,6 @@
 # PROVIDED HEREUNDER IS PROVIDED "AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE
 # MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
-import json
 import os
 
 import subprocess
@@ -58,16 +57,13 @@ class GCPCloudInstance(CloudInstance):
         self.cloud_service_provider = "GCP"
 
         id_ = str(uuid.uuid4())[0:8]
-        self._name = f'fog-{id_}-{self._name}'
+        self.set_name(f'fog-{id_}-{self._name}')
 
         self.zone = zone
         self.type = machine_type
         self.compute_instance_disk_size = disk_size  # GB
         self.gcp_ami_image = ami_image
 
-        self._working_dir = os.path.join(self._working_dir_base, self._name)
-        os.makedirs(self._working_dir, exist_ok=True)
-
         self._project_id = project_id
 
         # after config
@@ -84,18 +80,14 @@ class GCPCloudInstance(CloudInstance):
         self.install_colcon()
         self.install_cloud_dependencies()
         self.push_ros_workspace()
-        self.info(flush_to_disk=True)
-        self._is_created = True
+        self._created.set()
 
-    def info(self, flush_to_disk=True):
-        info_dict = super().info(flush_to_disk)
+    def _info_dict(self):
+        info_dict = super()._info_dict()
         info_dict["compute_region"] = self.zone
         info_dict["compute_instance_type"] = self.type
         info_dict["disk_size"] = self.compute_instance_disk_size
         info_dict["compute_instance_id"] = self._name
-        if flush_to_disk:
-            with open(os.path.join(self._working_dir, "info"), "w+") as f:
-                json.dump(info_dict, f)
         return info_dict
 
     def create_compute_engine_instance(self):
@@ -144,7 +136,7 @@ class GCPCloudInstance(CloudInstance):
                           read()).split(' ')[-1].strip().split('@')[0]
 
         self._ssh_key_path = f'/home/{user}/.ssh/google_compute_engine'
-        self._is_created = True
+        self._created.set()
 
         self.logger.info(
             f"Created {self.type} instance named {self._name} "
@@ -60,7 +60,7 @@ class KubeInstance(CloudInstance):
         self.cloud_service_provider = "ONPREM"
 
         id_ = str(uuid.uuid4())[0:8]
-        self._name = f"fog-{id_}-{self._name}"
+        self.set_name(f"fog-{id_}-{self._name}")
 
         self.zone = zone
         self.type = f"{mcpu}mx{mb}Mb"
@@ -69,9 +69,6 @@ class KubeInstance(CloudInstance):
         self._mcpu = mcpu
         self._mmb = mb
 
-        self._working_dir = os.path.join(self._working_dir_base, self._name)
-        os.makedirs(self._working_dir, exist_ok=True)
-
         # after config
         self._ssh_key = None
 
@@ -84,17 +81,13 @@ class KubeInstance(CloudInstance):
         self.connect()
         self.install_cloud_dependencies()
         self.push_ros_workspace()
-        self.info(flush_to_disk=True)
-        self._is_created = True
+        self._created.set()
 
-    def info(self, flush_to_disk=True):
-        info_dict = super().info(flush_to_disk)
+    def _info_dict(self):
+        info_dict = super()._info_dict()
         info_dict["compute_region"] = self.zone
         info_dict["compute_instance_type"] = self.type
         info_dict["compute_instance_id"] = self._name
-        if flush_to_disk:
-            with open(os.path.join(self._working_dir, "info"), "w+") as f:
-                json.dump(info_dict, f)
         return info_dict
 
     def force_start_vpn(self):
@@ -251,7 +244,7 @@ class KubeInstance(CloudInstance):
         self._vpn_ip = vpn_ip
 
         self._username = "ubuntu"
-        self._is_created = True
+        self._created.set()
 
         self.logger.info(
             f"Created {self.type} instance named {self._name} "
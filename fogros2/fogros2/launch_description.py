@@ -47,7 +47,6 @@ if TYPE_CHECKING:
 import pickle
 from collections import defaultdict
 from threading import Thread
-from time import sleep
 
 from .vpn import VPN
 
@@ -110,9 +109,9 @@ class FogROSLaunchDescription(LaunchDescriptionEntity):
         # tell remote machine to push the to cloud nodes and
         # wait here until all the nodes are done
         for machine in machines:
-            while not machine.is_created:
+            if not machine.is_created:
                 print(f"Waiting for machine {machine.name}")
-                sleep(1)
+                machine.wait_until_created()
             # machine is ready, # push to_cloud and setup vpn
             machine.push_to_cloud_nodes()
             machine.push_and_setup_vpn()
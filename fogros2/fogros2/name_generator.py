@@ -31,7 +31,7 @@
 # PROVIDED HEREUNDER IS PROVIDED "AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE
 # MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
-import random
+import secrets
 
 _adjectives = [
     "absolute",
@@ -3510,5 +3510,4 @@ _nouns = [
 
 
 def get_unique_name():
-    r = random.SystemRandom()
-    return f"{r.choice(_adjectives)}-{r.choice(_nouns)}"
+    return f"{secrets.choice(_adjectives)}-{secrets.choice(_nouns)}"
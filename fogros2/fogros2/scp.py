@@ -31,18 +31,22 @@
 # PROVIDED HEREUNDER IS PROVIDED "AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE
 # MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
+import os
 import select
+import shutil
 import sys
 from time import sleep
 
 import paramiko
 from rclpy import logging
-from scp import SCPClient as SCPClientBase
 
 # ec2 console coloring
 CRED = "\033[91m"
 CEND = "\033[0m"
 
+# read size used when streaming files to the remote
+SEND_BUFFER_SIZE = 1 << 20
+
 
 class SCPClient:
     def __init__(self, ip, ssh_key_path, username=None):
@@ -66,8 +70,11 @@ class SCPClient:
                     username=self.username,
                     pkey=self.ssh_key,
                     look_for_keys=False,
+                    allow_agent=False,
+                    banner_timeout=30,
                 )
                 connected = True
+                self.ssh_client.get_transport().set_keepalive(30)
             # TODO: Handle specific exceptions differently?
             # See https://docs.paramiko.org/en/stable/api/client.html
             except Exception as e:
@@ -76,10 +83,32 @@ class SCPClient:
         self.logger.info("SCP connected!")
 
     def send_file(self, src_path, dst_path):
-        with SCPClientBase(self.ssh_client.get_transport()) as scp:
-            scp.put(src_path, dst_path)
+        # SFTP resolves relative paths against the login directory and does
+        # not expand "~", so treat "~/" as relative.
+        if dst_path.startswith("~/"):
+            dst_path = dst_path[2:]
+        if dst_path.endswith("/"):
+            dst_path += os.path.basename(src_path)
+
+        # Pipelined writes don't wait for the server to ack each block,
+        # so throughput is no longer bounded by the round trip time.
+        with self.ssh_client.open_sftp() as sftp:
+            with open(src_path, "rb") as src, sftp.file(dst_path, "wb") as dst:
+                # Unlike scp, SFTP does not carry the file mode over. Apply
+                # it before writing, so secrets such as WireGuard configs are
+                # never readable by others on the remote.
+                dst.chmod(os.fstat(src.fileno()).st_mode & 0o777)
+                dst.set_pipelined(True)
+                shutil.copyfileobj(src, dst, length=SEND_BUFFER_SIZE)
+
+    def execute_cmd(self, cmd, check=False):
+        """
+        Run a command on the remote and stream its output locally.
 
-    def execute_cmd(self, cmd):
+        @param cmd: shell command to run
+        @param check: raise RuntimeError if the command exits non-zero
+        @return: the exit status of the command
+        """
         timeout = 300
         stdin, stdout, stderr = self.ssh_client.exec_command(
             cmd, get_pty=False
@@ -102,4 +131,10 @@ class SCPClient:
                     sys.stderr.buffer.flush()
         stdout.close()
         stderr.close()
-        ch.recv_exit_status()
+        exit_status = ch.recv_exit_status()
+        if exit_status != 0:
+            message = f"Remote command exited with status {exit_status}: {cmd}"
+            if check:
+                raise RuntimeError(message)
+            self.logger.warn(message)
+        return exit_status
@@ -33,7 +33,6 @@
 
 import errno
 import os
-import tarfile
 
 
 _work_dir_cache = None
@@ -71,30 +70,6 @@ def instance_dir():
     return _instance_dir_cache
 
 
-# Using Tar not Zip
-def make_zip_file(dir_name, target_path):
-    root_dir, workspace_name = os.path.split(dir_name)
-    print(root_dir, workspace_name)
-    base_name = os.path.abspath(target_path)
-    os.chdir(root_dir)
-
-    tar_compression = ''
-    archive_name = base_name + '.tar' + ''
-    archive_dir = os.path.dirname(archive_name)
-
-    # https://stackoverflow.com/questions/16000794/python-tarfile-and-excludes
-    EXCLUDE_FILES = ['.git']
-
-    if archive_dir and not os.path.exists(archive_dir):
-        os.makedirs(archive_dir)
-    tar = tarfile.open(archive_name, 'w|%s' % tar_compression)
-    try:
-        tar.add(workspace_name, filter=lambda x: None if x.name in EXCLUDE_FILES else x)
-    finally:
-        tar.close()
-    return archive_name
-
-
 def extract_bash_column(subprocess_output: str, column_name: str, row_number: int = 0):
     """Find the value of any given column value - ex: CLUSTER-IP -> 10.0.015.
 